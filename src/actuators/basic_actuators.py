@@ -1,5 +1,6 @@
 from gpiozero import LED
 
+from typing import Tuple
 from time import sleep
 
 
@@ -13,6 +14,9 @@ class BasicActuators():
         self.yellow_led = None
         self.green_led = None
 
+        # Last state written to red, yellow and green LEDs
+        self._state = [False, False, False]
+
         self.configured = False 
 
 
@@ -36,16 +40,29 @@ class BasicActuators():
             self.red_led    = LED(pin_red_led)
             self.yellow_led = LED(pin_yellow_led)
             self.green_led  = LED(pin_green_led) 
+            self.leds = [self.red_led, self.yellow_led, self.green_led]
             self.configured = True
 
         else: print("Initial config already defined")
 
-    def led_status(self):
+    def led_status(self, force: bool = False) -> Tuple[bool, bool, bool]:
+
+        """
+        
+        Function to get the LEDs status (red, yellow, green).
+
+        Parameters
+        ----------
+        force : bool
+            True to read the state back from the GPIO pins instead of returning 
+            the last state set by control_leds
+        
+        """
+
+        if force:
+            return self.red_led.is_lit, self.yellow_led.is_lit, self.green_led.is_lit
 
-        self.red_led_sts = self.red_led.is_lit
-        self.yellow_led_sts = self.yellow_led.is_lit
-        self.green_led_sts = self.green_led.is_lit 
-        return self.red_led_sts, self.yellow_led_sts, self.green_led_sts
+        return tuple(self._state)
 
 
     def control_leds(self, 
@@ -55,7 +72,8 @@ class BasicActuators():
 
         """
         
-        Function to control the the leds.
+        Function to control the the leds. Only the LEDs whose state changes are 
+        written to the GPIO pins.
 
         Parameters
         ----------
@@ -64,9 +82,12 @@ class BasicActuators():
         
         """
 
-        self.red_led.on() if red else self.red_led.off()
-        self.yellow_led .on() if yellow else self.yellow_led .off()
-        self.green_led.on() if green else self.green_led.off()
+        state = (bool(red), bool(yellow), bool(green))
+
+        for led, on, lit in zip(self.leds, state, self._state):
+            if on != lit: (led.on if on else led.off)()
+
+        self._state[:] = state
 
 
 if __name__ == "__main__":
@@ -3,12 +3,60 @@ from sensors import MultirangerSensor
 
 from pathlib import Path
 import threading
+import queue
 
 import csv
+import hashlib
+import logging
+import os
 
+from contextlib import contextmanager
 from time import sleep
 
 
+logger = logging.getLogger(__name__)
+
+# CPU cores the process may run on, read at import before any thread is pinned
+# (empty where the platform has no sched_setaffinity, e.g. macOS or Windows)
+ALLOWED_CPUS = os.sched_getaffinity(0) if hasattr(os, "sched_setaffinity") else set()
+
+
+def pin_to_cpu(cpu: int) -> None:
+
+    """
+    
+    Pin the calling thread to a CPU core. Nothing is done when the core is not 
+    one of the cores the process was started with.
+
+    :param cpu(int): CPU core index
+    
+    """
+
+    if cpu in ALLOWED_CPUS: os.sched_setaffinity(0, {cpu})
+
+
+@contextmanager
+def pinned_to_cpu(cpu: int):
+
+    """
+    
+    Pin the calling thread to a CPU core while the block runs, so the threads 
+    created inside it inherit that core, then restore the previous affinity.
+
+    :param cpu(int): CPU core index
+    
+    """
+
+    if cpu not in ALLOWED_CPUS: 
+        yield
+        return
+
+    previous = os.sched_getaffinity(0)
+    os.sched_setaffinity(0, {cpu})
+    try: yield
+    finally: os.sched_setaffinity(0, previous)
+
+
 class CreateDataset():
 
 
@@ -24,27 +72,42 @@ class CreateDataset():
     """
 
     CSV_PATH = Path(__file__).parent/"dataset"
+    CSV_FILE = CSV_PATH/"multiranger_data.csv"
+    CHECKSUM_FILE = CSV_PATH/"multiranger_data.csv.blake2b"
     HEADER = ["Front", "Back", "Right", "Left", "Up", "Status"]
+    STATUS = ("Nothing detected", "Anomaly Detected")
+    ANOMALY_DISTANCE = 0.3
+    SAMPLE_PERIOD = 0.3
+    SAMPLE_QUEUE_SIZE = 4096
+    WRITE_BATCH_SIZE = 100
+    LINK_CPU = 1
+    CAPTURE_CPU = 2
 
 
-    def __init__(self) -> None:
+    def __init__(self, checksum: bool = False) -> None:
 
         """
         
         Create dataset constructor:
 
         Init crazyflie actuator, threading and sincronization parameters.
+
+        :param checksum(bool): write a BLAKE2b digest of the dataset file next to 
+         it at cleanup
         
         """
 
-        self.crazyflie = CrazyflieActuator()
-        self.crazyflie.initial_config()
+        # cflib packet handling thread is created here and keeps the link core
+        with pinned_to_cpu(CreateDataset.LINK_CPU):
+            self.crazyflie = CrazyflieActuator()
+            self.crazyflie.initial_config()
 
 
         self.thread_get_data = threading.Thread(target = self.get_data)
-        self.lock = threading.Lock()
-        self.data = list()
-        self.finish = False
+        self.thread_write_data = threading.Thread(target = self.write_csv_file)
+        self._stop_event = threading.Event()
+        self._sample_q = queue.Queue(maxsize = CreateDataset.SAMPLE_QUEUE_SIZE)
+        self.checksum = checksum
         self.cleaned = False
 
 
@@ -58,11 +121,16 @@ class CreateDataset():
         """
 
         print("Connecting with drone")
-        self.crazyflie.connect()
+        # cflib radio link threads are created when the link opens
+        with pinned_to_cpu(CreateDataset.LINK_CPU): self.crazyflie.connect()
 
         self.multiranger = MultirangerSensor(sync_crazyflie = self.crazyflie.sync_crazyflie)
         self.multiranger.initial_config()
 
+        self._csv_file = open(CreateDataset.CSV_FILE, "a", newline = "", buffering = 1 << 20)
+        self._writer = csv.writer(self._csv_file)
+        self.thread_write_data.start()
+
 
     def move_crazyflie(self)-> None:
 
@@ -74,7 +142,8 @@ class CreateDataset():
         
         self.mc = self.crazyflie.motion_commander
 
-        self.mc.take_off()        
+        # The motion commander setpoint thread is created at take off
+        with pinned_to_cpu(CreateDataset.LINK_CPU): self.mc.take_off()
         print("Take off")
         sleep(1.0)
         self.thread_get_data.start()
@@ -86,7 +155,7 @@ class CreateDataset():
 
         print("Rotating 360° clockwise!")
         self.mc.turn_right(360)
-        with self.lock: self.finish = True
+        self._stop_event.set()
         sleep(1.0)
 
 
@@ -94,23 +163,26 @@ class CreateDataset():
 
         """
         
-        Gets data from each of five lidars from Multiranger Deck and store it in a 
-        list.
+        Gets data from each of five lidars from Multiranger Deck and queue it to
+        be written in the CSV file.
         
         """
 
 
-        while not self.finish:
-            front, back, right, left, up = self.multiranger.get_data()
-            sample = [front, back, right, left, up]
+        pin_to_cpu(CreateDataset.CAPTURE_CPU)
 
-            if not any(value is None for value in sample):
-                status = "Nothing detected" if not any(distance <= 0.3 for distance in sample) else "Anomaly Detected"
-                sample.append(status)
-                self.data.append(sample)
+        get_sample = self.multiranger.get_data
+        put_sample = self._sample_q.put
+        stop_event = self._stop_event
 
-                print(f"Front: {front} \nBack: {back} \nRight: {right} \nLeft: {left} \nUp: {up}")
-            sleep(0.3)
+        while not stop_event.is_set():
+            sample = get_sample()
+
+            if None not in sample:
+                put_sample(sample)
+                logger.debug("Front: %s Back: %s Right: %s Left: %s Up: %s", *sample)
+
+            stop_event.wait(CreateDataset.SAMPLE_PERIOD)
         print("Finish get data")
 
     
@@ -125,19 +197,64 @@ class CreateDataset():
 
         try: self.move_crazyflie()
         except KeyboardInterrupt:...
-        except Exception as ex: print(ex)
+        except (OSError, RuntimeError, ValueError) as ex: print(ex)
         finally: self.cleanup()
 
 
     def write_csv_file(self) -> None:
 
-        if len(self.data) > 5:
+        """
+        
+        Drain the sample queue into the CSV file in batches until the None 
+        sentinel is received. The status column is derived here from the five 
+        distances, so the queue only holds the raw distance tuples. Pending rows 
+        are also written whenever the queue stays idle for a second, so a killed 
+        run keeps what was captured.
+
+        Runs with five samples or less are discarded.
+        
+        """
+
+        batch = list()
+        rows = 0
+        finished = False
+
+        while not finished:
+            try: sample = self._sample_q.get(timeout = 1.0)
+            except queue.Empty: idle = True
+            else:
+                idle = False
+                finished = sample is None
+                if not finished: batch.append(sample)
+
+            flush = idle or finished or len(batch) >= CreateDataset.WRITE_BATCH_SIZE
+            if flush and batch and rows + len(batch) > 5:
+                self._writer.writerows((*sample, 
+                                        CreateDataset.STATUS[min(sample) <= CreateDataset.ANOMALY_DISTANCE])
+                                       for sample in batch)
+                self._csv_file.flush()
+                rows += len(batch)
+                batch.clear()
+
+        if rows: print(f"{rows} samples written in csv file")
+
 
-            print("Writing data in csv file")
-            with open(f"{CreateDataset.CSV_PATH}/multiranger_data.csv", "a") as file:
-                writer = csv.writer(file)
-                for i in self.data:
-                    writer.writerow(i)
+    def write_checksum(self) -> None:
+
+        """
+        
+        Write a 128 bits BLAKE2b digest of the whole dataset file in a sidecar 
+        file, in the format checked by 'b2sum -l 128 -c'.
+        
+        """
+
+        digest = hashlib.blake2b(digest_size = 16)
+
+        with open(CreateDataset.CSV_FILE, "rb") as file:
+            while chunk := file.read(1 << 20):
+                digest.update(chunk)
+
+        CreateDataset.CHECKSUM_FILE.write_text(f"{digest.hexdigest()}  {CreateDataset.CSV_FILE.name}\n")
 
 
     def cleanup(self) -> None:
@@ -149,16 +266,27 @@ class CreateDataset():
         """
 
         if not self.cleaned:
+            self._stop_event.set()
+            if self.thread_get_data.is_alive(): self.thread_get_data.join()
+
+            # Let the writer thread drain the remaining samples while landing
+            self._sample_q.put(None)
+
             self.mc.land()
             self.crazyflie.disconnect()
             self.multiranger.close()
-            self.write_csv_file()
+
+            self.thread_write_data.join()
+            self._csv_file.close()
+            if self.checksum: self.write_checksum()
             self.cleaned = True
 
         else: print("Already cleaned")
 
 
 if __name__ == "__main__":
+
+    logging.basicConfig(level = logging.WARNING)
         
     dataset = CreateDataset()
     dataset.initial_config()
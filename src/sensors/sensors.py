@@ -2,15 +2,16 @@ from abc import ABC, abstractmethod
 from typing import Tuple
 
 import time
+import queue
 
 import board
 
 import adafruit_bmp280
 import adafruit_dht
-from gpiozero import MotionSensor, Button
+from gpiozero import MotionSensor, Button, GPIOZeroError
 
 from cflib.crazyflie.syncCrazyflie import SyncCrazyflie
-from cflib.utils.multiranger import Multiranger
+from cflib.crazyflie.log import LogConfig
 
 
 class Sensor(ABC):
@@ -41,7 +42,7 @@ class Sensor(ABC):
         if not self.configured: 
             try:
                 self._setup()
-            except Exception as ex: 
+            except (OSError, RuntimeError, ValueError, KeyError, GPIOZeroError) as ex: 
                 print(f"Erro has occured while setting up sensor: {ex}")
                 return
             else: self.configured = True
@@ -171,13 +172,29 @@ class ButtonSensor(Sensor):
 
 class MultirangerSensor(Sensor):
 
+    RANGES = ("range.front", "range.back", "range.right", "range.left", "range.up")
+    OUT_OF_RANGE = 8000 # mm
+
     def __init__(self, 
                  name: str = "Multiranger Deck", 
-                 sync_crazyflie: SyncCrazyflie = None) -> None:
+                 sync_crazyflie: SyncCrazyflie = None,
+                 period_in_ms: int = 100) -> None:
+
+        """
+        Multiranger Deck sensor constructor
+
+        :param sync_crazyflie(SyncCrazyflie): connected Crazyflie carrying the deck
+        :param period_in_ms(int): period of the deck log block
+
+        """
 
         super().__init__(name)
 
         self.__sync_crazyflie = sync_crazyflie
+        self.period_in_ms = period_in_ms
+
+        self.__sample = (None, None, None, None, None)
+        self.__samples = None
 
     def initial_config(self) -> None:
 
@@ -185,20 +202,63 @@ class MultirangerSensor(Sensor):
 
     def _setup(self) -> None:
 
-        self.__multiranger_deck = Multiranger(self.__sync_crazyflie)
-        self.__multiranger_deck.start()
+        self.__log_config = LogConfig(name = "multiranger", period_in_ms = self.period_in_ms)
+        for variable in MultirangerSensor.RANGES:
+            self.__log_config.add_variable(variable)
+
+        self.__log_config.data_received_cb.add_callback(self.__data_received)
+        self.__sync_crazyflie.cf.log.add_config(self.__log_config)
+        self.__log_config.start()
+
+    def __data_received(self, timestamp: int, data: dict, log_config: LogConfig) -> None:
+
+        """
+        
+        Log block callback: converts the ranges to meters (None when out of range)
+        and queues the sample if it is being streamed.
+        
+        """
+
+        self.__sample = tuple(None if data[variable] >= MultirangerSensor.OUT_OF_RANGE 
+                              else data[variable] / 1000.0 
+                              for variable in MultirangerSensor.RANGES)
+
+        samples = self.__samples
+        if samples is not None: samples.put(self.__sample)
 
-    def get_data(self) -> None:
+    def get_data(self) -> Tuple[float, float, float, float, float]:
+
+        """
+        
+        Returns the last front, back, right, left and up distances received.
+        
+        """
+
+        super().get_data()
+
+        return self.__sample
+
+    def stream(self) -> queue.SimpleQueue:
+
+        """
+        
+        Queue every sample received from now on, at the deck log period, until 
+        the sensor is closed.
+
+        Returns:
+            queue.SimpleQueue with the (front, back, right, left, up) samples
+        
+        """
 
         super().get_data()
 
-        return self.__multiranger_deck.front, self.__multiranger_deck.back,\
-               self.__multiranger_deck.right, self.__multiranger_deck.left,\
-               self.__multiranger_deck.up
+        self.__samples = queue.SimpleQueue()
+        return self.__samples
 
     def close(self) -> None:
 
-        self.__multiranger_deck.stop()
+        self.__samples = None
+        self.__log_config.delete()
 
 
 if __name__ == "__main__":
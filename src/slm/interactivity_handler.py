@@ -1,6 +1,13 @@
-import json
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    from json import loads as json_loads
 
 from typing import Tuple
+from functools import lru_cache
+
+import re
+import sys
 
 
 class InteractivityHandler():
@@ -31,6 +38,20 @@ class InteractivityHandler():
                         valid JSON containing both "message" and "leds" fields.
                         """
 
+    # Prompt templates filled with str.format on every user turn
+    COMPLETE_PROMPT = ("STATUS:\nDHT22={:.1f}°C/{:.1f}% BMP280={:.1f}°C/{:.2f}hPa "
+                       "Button={} LEDs: R={}/Y={}/G={}\nUSER: {}")
+    INSPECTION_PROMPT = "STATUS:\nMotion={} LEDs: R={}/Y={}/G={}"
+
+    ON_OFF = ("OFF", "ON")
+    BUTTON = ("OFF", "PRESSED")
+    MOTION = ("NOT DETECTED", "DETECTED")
+    LED_ICON = ("○", "●")
+
+    # Body of the markdown code fence (```json ... ```) the SLM may wrap its JSON 
+    # response in, with or without text after it or a closing fence
+    CODE_FENCE = re.compile(r"```(?:json)?\s*(.*?)\s*(?:```|\Z)", re.DOTALL | re.IGNORECASE)
+
     CRAZYFLIE_INSPECTION_TOOL = {
             "type": "function",
             "function": {
@@ -52,7 +73,7 @@ class InteractivityHandler():
                         button_state:  bool, 
                         led_red_sts :  bool, 
                         led_ylw_sts :  bool, 
-                        led_grn_sts :   str,
+                        led_grn_sts :  bool,
                         user_input  :   str) -> str:
 
 
@@ -73,46 +94,64 @@ class InteractivityHandler():
         
         """
 
-        return f"""STATUS: 
-                    DHT22={temp_dht:.1f}°C/{hum:.1f}% BMP280={temp_bmp:.1f}°C/{press:.2f}hPa 
-                    Button={'PRESSED' if button_state else 'OFF'} 
-                    LEDs:
-                        R={'ON' if led_red_sts else 'OFF'}/
-                        Y={'ON' if led_ylw_sts else 'OFF'}/
-                        G={'ON' if led_grn_sts else 'OFF'}
-                    USER: {user_input} """
+        on_off = InteractivityHandler.ON_OFF
+
+        return InteractivityHandler.COMPLETE_PROMPT.format(temp_dht, hum, temp_bmp, press,
+                                                           InteractivityHandler.BUTTON[button_state],
+                                                           on_off[led_red_sts],
+                                                           on_off[led_ylw_sts],
+                                                           on_off[led_grn_sts],
+                                                           user_input)
 
     @staticmethod
+    @lru_cache(maxsize = 16)
     def smart_inspection_prompt(motion_data: bool,
                                 led_red_sts: bool,
                                 led_ylw_sts: bool,
-                                led_grn_sts: bool,
-                                user_input: str) -> str:
+                                led_grn_sts: bool) -> str:
+
+        """
+        
+        Create the sensors status prompt sent along with each user message in 
+        the smart inspection interactive mode. There are only 16 possible 
+        prompts, so they are cached and an unchanged status reuses the same 
+        string.
 
-        return f"""STATUS: 
-                    Motion={'DETECTED' if motion_data else 'NOT DETECTED'} 
-                    LEDs:
-                        R={'ON' if led_red_sts else 'OFF'}/
-                        Y={'ON' if led_ylw_sts else 'OFF'}/
-                        G={'ON' if led_grn_sts else 'OFF'}
-                    USER: {user_input} """
+        :param motion_data(bool): motion sensor data (True for detected)
+        :param led_red_sts(bool): Red LED status
+        :param led_ylw_sts(bool): Yellow LED status
+        :param led_grn_sts(bool): Green LED status
+        
+        """
+
+        on_off = InteractivityHandler.ON_OFF
+
+        return InteractivityHandler.INSPECTION_PROMPT.format(InteractivityHandler.MOTION[motion_data],
+                                                             on_off[led_red_sts],
+                                                             on_off[led_ylw_sts],
+                                                             on_off[led_grn_sts])
 
 
     @staticmethod
     def instructions_for_user(model: str) -> None:
 
-        print("\n" + "="*60)
-        print("Smart Inspection System - Interactive Mode")
-        print(f"Using Model: {model} (Optimized)")
-        print("="*60)
-        print("\nCommands you can try:")
-        print("  - Turn on the yellow LED")
-        print("  - Turn on all LEDs")
-        print("  - Turn off all LEDs")        
-        print("  - Type 'status' to see system status")
-        print("  - For drone inspection without sensor check, type: 'Drone'/'Crazyflie/Fly'")
-        print("  - Type 'exit' or 'quit' to stop")
-        print("="*60 + "\n")
+        sys.stdout.write("\n".join([
+            "",
+            "="*60,
+            "Smart Inspection System - Interactive Mode",
+            f"Using Model: {model} (Optimized)",
+            "="*60,
+            "",
+            "Commands you can try:",
+            "  - Turn on the yellow LED",
+            "  - Turn on all LEDs",
+            "  - Turn off all LEDs",
+            "  - Type 'status' to see system status",
+            "  - For drone inspection without sensor check, type: 'Drone'/'Crazyflie/Fly'",
+            "  - Type 'exit' or 'quit' to stop",
+            "="*60,
+            "",
+            ""]))
 
     @staticmethod
     def interactive_response(response_text: dict) -> Tuple[str, Tuple[bool, bool, bool]]:
@@ -129,13 +168,11 @@ class InteractivityHandler():
         try:
             # Clean the response
             response_text = response_text.strip()
-            if response_text.startswith('```'):
-                lines = response_text.split('\n')
-                response_text = '\n'.join(lines[1:-1]) if len(lines) > 2 else response_text
-                response_text = response_text.replace('```json', '').replace('```', '').strip()
+            fenced = InteractivityHandler.CODE_FENCE.search(response_text)
+            if fenced: response_text = fenced.group(1)
             
             # Parse JSON
-            data = json.loads(response_text)
+            data = json_loads(response_text)
             
             # Extract message
             message = data.get('message', 'No response provided.')
@@ -150,10 +187,10 @@ class InteractivityHandler():
             
             return message, (red_led, yellow_led, green_led, motion)
         
-        except (json.JSONDecodeError, KeyError) as e:
+        except (ValueError, KeyError) as e:
             print(f"Error parsing JSON response: {e}")
             print(f"Response was: {response_text}")
-            return "Error: Could not parse SLM response.", (False, False, False)
+            return "Error: Could not parse SLM response.", (False, False, False, None)
 
 
     @staticmethod
@@ -174,13 +211,18 @@ class InteractivityHandler():
 
 
         led_red_sts, led_ylw_sts, led_grn_sts = leds_status
-
-        print("\n" + "="*60)
-        print("SYSTEM STATUS")
-        print("="*60)
-        print(f"Motion:        {'DETECTED' if motion_data else 'NOT DETECTED'}")
-        print(f"\nLED Status:")
-        print(f"  Red LED:    {'●' if led_red_sts else '○'} {'ON' if led_red_sts else 'OFF'}")
-        print(f"  Yellow LED: {'●' if led_ylw_sts else '○'} {'ON' if led_ylw_sts else 'OFF'}")
-        print(f"  Green LED:  {'●' if led_grn_sts else '○'} {'ON' if led_grn_sts else 'OFF'}")
-        print("="*60)
+        icon, on_off = InteractivityHandler.LED_ICON, InteractivityHandler.ON_OFF
+
+        sys.stdout.write("\n".join([
+            "",
+            "="*60,
+            "SYSTEM STATUS",
+            "="*60,
+            f"Motion:        {InteractivityHandler.MOTION[motion_data]}",
+            "",
+            "LED Status:",
+            f"  Red LED:    {icon[led_red_sts]} {on_off[led_red_sts]}",
+            f"  Yellow LED: {icon[led_ylw_sts]} {on_off[led_ylw_sts]}",
+            f"  Green LED:  {icon[led_grn_sts]} {on_off[led_grn_sts]}",
+            "="*60,
+            ""]))
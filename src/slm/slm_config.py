@@ -1,19 +1,66 @@
 import ollama
 
+from collections import deque
+from functools import lru_cache
+from typing import Optional, Union
+
+
+@lru_cache(maxsize = None)
+def _client(host: Optional[str] = None) -> ollama.Client:
+
+    """
+    
+    Ollama client for a daemon host, created once per process.
+
+    :param host(str): Ollama daemon address. Default is OLLAMA_HOST or the local 
+     daemon.
+    
+    """
+
+    return ollama.Client(host)
+
+
+@lru_cache(maxsize = None)
+def _available_models(host: Optional[str] = None) -> frozenset:
+
+    """
+    
+    Names of the models installed in an Ollama daemon, fetched once per process 
+    with the same client used for the chat requests.
+
+    :param host(str): Ollama daemon address
+    
+    """
+
+    return frozenset(model.model for model in _client(host).list().models)
+
 
 class SLMConfig():
     
+    # Same keep-alive and context size on every request, so Ollama keeps the loaded
+    # model and its prompt cache instead of reloading it between turns
+    KEEP_ALIVE = "30m"
+    OPTIONS = {"num_ctx": 2048}
 
-    def __init__(self, model: str) -> None:
+    def __init__(self, 
+                 model: str, 
+                 keep_alive: Union[str, int] = KEEP_ALIVE,
+                 host: Optional[str] = None) -> None:
 
         """
         SLM Config constructor
 
         :param model(str): name of the model to load with ollama library
+        :param keep_alive(str | int): how long Ollama keeps the model and its prompt
+         cache loaded after a request (e.g. "30m", or -1 to keep it until unloaded)
+        :param host(str): Ollama daemon address. Default is OLLAMA_HOST or the 
+         local daemon.
 
         """
 
-        self.available_models = [model.model for model in ollama.list().models]
+        self._client = _client(host)
+        self.keep_alive = keep_alive
+        self.available_models = _available_models(host)
         self.model = model
         self.tools = list()
 
@@ -28,36 +75,51 @@ class SLMConfig():
             self._model = value
         else: raise ValueError(f"{value} model not available")
 
-    def inference(self, messages: list):
+    def inference(self, messages: list, stream: bool = False, tools: Optional[list] = None):
 
         """
         
         Send chat request to Ollama using chat API.
+
+        :param stream(bool): if True, returns an iterator of response chunks as 
+         the tokens are generated instead of the complete response
+        :param tools(list): tools for this request only. Default is the 'tools' 
+         attribute
         
         """
 
-        response = ollama.chat(
+        response = self._client.chat(
             model=self.model,
             messages=messages,
-            tools = self.tools
+            tools = self.tools if tools is None else tools,
+            stream = stream,
+            keep_alive = self.keep_alive,
+            options = SLMConfig.OPTIONS
         )
 
         return response
 
 
-    def preload_model(self):
+    def preload_model(self, messages: Optional[list] = None):
         
         """
         
         Pre-load the model into memory to avoid loading delays.
+
+        :param messages(list): messages every conversation starts with (e.g. the 
+         system message). They are evaluated with the current tools so that the 
+         first user turn reuses their prompt cache.
         
         """
 
         print(f"Pre-loading model {self.model}...")
         try:
-            ollama.chat(
+            self._client.chat(
                 model=self.model,
-                messages=[{"role": "user", "content": "hi"}]
+                messages=messages or [{"role": "user", "content": "hi"}],
+                tools = self.tools,
+                keep_alive = self.keep_alive,
+                options = {**SLMConfig.OPTIONS, "num_predict": 1}
             )
             print(f"Model {self.model} loaded successfully!\n")
         except Exception as e:
@@ -65,12 +127,24 @@ class SLMConfig():
             print("Model will load on first use.\n")
 
 
+    def unload_model(self):
+
+        """
+        
+        Unload the model and its prompt cache from memory.
+        
+        """
+
+        try: self._client.chat(model = self.model, messages = [], keep_alive = 0)
+        except Exception as e: print(f"Warning: Could not unload model: {e}")
+
+
                 
 def main() -> None:
 
     slm = SLMConfig("llama3.2:3b")
     slm.preload_model()
-    messages = list()
+    history = deque(maxlen = 4)  # 4 most recent user/assistant messages
     try:
         while True:
 
@@ -80,26 +154,27 @@ def main() -> None:
                 print("\nExiting interactive mode. Goodbye!")
                 break
 
-            messages.append({
+            history.append({
                 "role": "user",
                 "content": user_input
             })
 
-            print("Assistant: [Thinking...]")
-            response = slm.inference(messages)
+            print("Assistant: ", end = "", flush = True)
+            chunks = list()
+            for chunk in slm.inference(list(history), stream = True):
+                print(chunk['message']['content'], end = "", flush = True)
+                chunks.append(chunk['message']['content'])
+            print()
 
-            assistant_content = response['message']['content']
-            print(assistant_content)
-            messages.append({
-                "role": "user",
+            assistant_content = "".join(chunks)
+            history.append({
+                "role": "assistant",
                 "content": assistant_content
             })
 
-            if len(messages) > 9:  # system message + 8 user/assistant messages
-                messages = [messages[0]] + messages[-8:]
-
     except KeyboardInterrupt:...
-    except Exception as ex: print(f"SLM test gets an error: {ex}")
+    except (OSError, RuntimeError, ValueError, ollama.ResponseError) as ex: 
+        print(f"SLM test gets an error: {ex}")
 
 
 if __name__ == "__main__":
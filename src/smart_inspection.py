@@ -2,17 +2,26 @@ from actuators import BasicActuators, CrazyflieActuator
 from sensors import PIRMotionDetector, MultirangerSensor
 from slm import SLMConfig, InteractivityHandler
 
-from typing import Tuple
-from time import sleep
+from typing import Optional, Tuple
+from time import sleep, monotonic
 from pathlib import Path
+from collections import deque
 
 import logging
+import math
+import re
 
 import threading
+import queue
 
 import csv
 
 
+log_handler = logging.StreamHandler()
+log_handler.setLevel(logging.DEBUG)
+log_handler.setFormatter(logging.Formatter('%(asctime)s [%(levelname)s]: %(message)s'))
+
+
 class SmartInspection():
 
     """
@@ -21,6 +30,18 @@ class SmartInspection():
     
     """
 
+    CSV_FILE = Path(__file__).resolve().parent/"inspection_data.csv"
+    HEADER = ["Front", "Back", "Right", "Left", "Up", "Status"]
+    STATUS = ("Nothing detected", "Anomaly Detected")
+    ANOMALY_DISTANCE = 0.3
+    # Time the deck must read an anomaly for the inspection to report one
+    # (4 samples when it was polled every 0.3 s)
+    ANOMALY_TIME_MS = 1200
+    SETTLE_TIME = 1.0
+
+    # User request for a drone inspection ('drone', 'drones', 'fly', 'flying', ...)
+    DRONE_REQUEST = re.compile(r"\b(?:crazyflie|drone|fly)", re.IGNORECASE)
+
     def __init__(self) -> None:
 
         """
@@ -49,32 +70,34 @@ class SmartInspection():
         self.basic_actuators.initial_config()
         self.motion_detector.initial_config()
         self.crazyflie.initial_config()
-        self.slm = SLMConfig(model = model)
+        # Keep the model and its prompt cache loaded for the whole session
+        self.slm = SLMConfig(model = model, keep_alive = -1)
+        self.slm.tools = [InteractivityHandler.CRAZYFLIE_INSPECTION_TOOL]
         self.model = model
 
         self.logger = logging.getLogger(__name__)
         self.logger.setLevel(logging.DEBUG)
+        self.logger.propagate = False
 
-        ch = logging.StreamHandler()
-        ch.setLevel(logging.DEBUG)
-
-        formatter = logging.Formatter('%(asctime)s [%(levelname)s]: %(message)s')
-        ch.setFormatter(formatter)
-
-        self.logger.addHandler(ch)
+        if log_handler not in self.logger.handlers: self.logger.addHandler(log_handler)
 
         self.multiranger = None
-        self.locker = threading.Lock()
-        self.stop_mult_thread = False
+        self.stop_mult_thread = threading.Event()
         self.mult_rng_data = list()
+        self._anomaly_count = 0
         self.final_inspection_result = False
 
-        self.messages = [
-                {
-                    "role": "system",
-                    "content": InteractivityHandler.SYSTEM_MESSAGE
-                }
-            ]
+        self._system_msg = {
+                "role": "system",
+                "content": InteractivityHandler.SYSTEM_MESSAGE
+            }
+        
+        # Recent conversation (8 user/assistant messages)
+        self._history = deque(maxlen = 8)
+
+        # Reused on every turn to build the SLM request
+        self._status_msg = {"role": "user", "content": ""}
+        self._request = list()
 
 
     def __get_all_data(self) -> Tuple[bool, Tuple[bool, bool, bool]]:
@@ -92,11 +115,16 @@ class SmartInspection():
         return self.motion_detector.get_data(), self.basic_actuators.led_status()
 
 
-    def get_user_message(self, user_input: str) -> str:
+    def get_status_message(self) -> Optional[dict]:
 
         """
         
-        Returns movement sensor data and red, yellow, green leds status.
+        Returns a user message with movement sensor data and red, yellow, green 
+        leds status, or None if the data could not be read.
+
+        It is sent right before the user message of the current turn and is not 
+        kept in the conversation history, so the history prefix sent to the SLM 
+        stays the same between turns and Ollama can reuse its prompt cache.
         
         """
 
@@ -109,15 +137,13 @@ class SmartInspection():
             self.logger.exception(f"Assistant error: unable to get fisic infos. \
                                    Please, try again. \n{ex}")
             
-            return user_input
+            return None
 
-        else: 
-            user_msg = InteractivityHandler.smart_inspection_prompt(movement,
-                                                                    led_red_sts,
-                                                                    led_ylw_sts,
-                                                                    led_grn_sts,
-                                                                    user_input)
-        return user_msg
+        self._status_msg["content"] = InteractivityHandler.smart_inspection_prompt(movement,
+                                                                                   led_red_sts,
+                                                                                   led_ylw_sts,
+                                                                                   led_grn_sts)
+        return self._status_msg
 
 
     def interactive_mode(self)-> None:
@@ -129,7 +155,7 @@ class SmartInspection():
         """
         
         InteractivityHandler.instructions_for_user(self.model)
-        self.slm.preload_model()
+        self.slm.preload_model([self._system_msg])
 
         while True:
 
@@ -148,20 +174,33 @@ class SmartInspection():
                 InteractivityHandler.display_status(motion, leds_status)
                 continue
             
-            if any(word in msg for word in ['crazyflie', 'drone', 'fly']):
-                self.slm.tools.append(InteractivityHandler.CRAZYFLIE_INSPECTION_TOOL)
-            else: self.slm.tools = list()
-            
-            user_msg = self.get_user_message(user_input)
+            # The tool list never changes, the inspection tool call is only 
+            # honored when the user asked for the drone
+            drone_request = SmartInspection.DRONE_REQUEST.search(user_input) is not None
             
-            self.messages.append({
+            user_message = {
                 "role": "user",
-                "content": user_msg
-            })
+                "content": user_input
+            }
+            status_message = self.get_status_message()
+
+            request = self._request
+            request.clear()
+            request.append(self._system_msg)
+            request.extend(self._history)
+            if status_message: request.append(status_message)
+            request.append(user_message)
             
             # Get SLM response using chat API
             print("Assistant: [Thinking...]")
-            response = self.slm.inference(self.messages)
+            response = self.slm.inference(request)
+
+            if response.message.tool_calls and not drone_request:
+                # Tool calls are only honored on drone requests, ask again without 
+                # tools to get the JSON reply for this turn
+                response = self.slm.inference(request, tools = list())
+
+            self._history.append(user_message)
 
             if response.message.tool_calls:
 
@@ -183,7 +222,7 @@ class SmartInspection():
                                                     interactive_response(assistant_content)
             
             # Add assistant's response to conversation history
-            self.messages.append({
+            self._history.append({
                 "role": "assistant",
                 "content": assistant_content
             })
@@ -206,12 +245,6 @@ class SmartInspection():
                         self.__final_inspection_response()
 
 
-            
-            # Keep only system message + recent conversation (8 user/assistant messages)
-            if len(self.messages) > 9:
-                self.messages = [self.messages[0]] + self.messages[-8:]
-
-
     def __crazyflie_inspection(self) -> None:
 
         """
@@ -225,50 +258,61 @@ class SmartInspection():
         """
 
         self.mult_rng_thread = threading.Thread(target = self.__multiranger_get_data)
+        self.stop_mult_thread.clear()
+        self.mult_rng_data = list()
+        self._anomaly_count = 0
 
         self.logger.info("Connecting with drone")
         self.crazyflie.connect()
         
-        try:
-            self.multiranger = MultirangerSensor(sync_crazyflie = self.crazyflie.sync_crazyflie)
-            self.multiranger.initial_config()
-        
-        except Exception as ex:
-
-            self.logger.error(f"Error while setting up Multiranger Sensor: {ex}")
-            with self.locker: self.stop_mult_thread = True
-            self.mult_rng_thread.join()
+        self.multiranger = MultirangerSensor(sync_crazyflie = self.crazyflie.sync_crazyflie)
+        self.multiranger.initial_config()
 
+        if not self.multiranger.configured:
+            self.logger.error("Error while setting up Multiranger Sensor")
             return
 
         mc = self.crazyflie.motion_commander
 
         mc.take_off()
         self.logger.info("Take off")
-        sleep(1.0)
+        completed = False
+
+        try:
+            sleep(SmartInspection.SETTLE_TIME)
 
-        self.mult_rng_thread.start()
+            self.mult_rng_thread.start()
 
-        self.logger.info("Starting capture data from multiranger deck")
-        self.logger.info("Rotating 360° counter-clockwise!")
-        mc.turn_left(360)
+            self.logger.info("Starting capture data from multiranger deck")
+            self.logger.info("Rotating 360° counter-clockwise!")
+            mc.turn_left(360)
 
-        sleep(1.0)
+            sleep(SmartInspection.SETTLE_TIME)
 
-        self.logger.info("Rotating 360° clockwise!")
-        mc.turn_right(360)
+            self.logger.info("Rotating 360° clockwise!")
+            mc.turn_right(360)
+            completed = True
 
-        with self.locker: self.stop_mult_thread = True
-        self.multiranger.close()
-        self.mult_rng_thread.join()
+        finally:
+            # Also on errors and Ctrl-C: stop the capture thread and land
+            settled = monotonic() + SmartInspection.SETTLE_TIME
 
-        sleep(1.0)
+            try:
+                self.stop_mult_thread.set()
+                if self.mult_rng_thread.is_alive(): self.mult_rng_thread.join()
+                self.multiranger.close()
 
-        self.logger.info("Landing the drone")
-        mc.land()
+                # The CSV is written while the drone settles, landing waits only 
+                # for what is left of the settle time
+                if completed: self.write_csv_file()
+                sleep(max(0.0, settled - monotonic()))
+
+            finally:
+                # Nothing above may keep the drone from landing
+                self.logger.info("Landing the drone")
+                mc.land()
 
         self.crazyflie.disconnect()
-        self.write_csv_file()
 
 
     def __multiranger_get_data(self) -> None:
@@ -276,24 +320,23 @@ class SmartInspection():
         """
 
         Function to get data from Mulitanger deck distance sensors.
-        As long as the 'stop_mult_thread' attribute is not set, the data is
-        registered in the 'mult_rng_data' list
+        As long as the 'stop_mult_thread' event is not set, every sample streamed
+        by the deck is registered in the 'mult_rng_data' list
 
         """
-        
-        while not self.stop_mult_thread:
-            front, back, right, left, up = self.multiranger.get_data()
-            sample = [front, back, right, left, up]
 
-            if not any(value is None for value in sample):
-                status = "Nothing detected" if not any(distance <= 0.3 for distance in sample) else "Anomaly Detected"
-                sample.append(status)
-                self.mult_rng_data.append(sample)
-
-            sleep(0.3)
+        samples = self.multiranger.stream()
+        
+        while not self.stop_mult_thread.is_set():
+            try: sample = samples.get(timeout = 0.1)
+            except queue.Empty: continue
+
+            if None not in sample:
+                anomaly = min(sample) <= SmartInspection.ANOMALY_DISTANCE
+                self.mult_rng_data.append((*sample, SmartInspection.STATUS[anomaly]))
+                self._anomaly_count += anomaly
         
         self.logger.info("Finish get data")
-        with self.locker: self.stop_mult_thread = False
 
 
     def write_csv_file(self) -> None:
@@ -305,22 +348,17 @@ class SmartInspection():
 
         """
 
-        path = Path(__file__).parent/"inspection_data.csv"
-        header = ["Front", "Back", "Right", "Left", "Up", "Status"]
-        count_anomaly = 0
-
         if len(self.mult_rng_data) > 5:
 
             self.logger.info("Writing data in csv file")
-            with open(str(path), "w") as file:
+            with open(SmartInspection.CSV_FILE, "w", newline = "", buffering = 1 << 20) as file:
                 writer = csv.writer(file)
-                writer.writerow(header)
-                for i in self.mult_rng_data:
-                    writer.writerow(i)
-                    if not self.final_inspection_result and i[5] == "Anomaly Detected":
-                        count_anomaly += 1
-                    
-                    if count_anomaly >= 4: self.final_inspection_result = True
+                writer.writerow(SmartInspection.HEADER)
+                writer.writerows(self.mult_rng_data)
+
+            min_anomalies = math.ceil(SmartInspection.ANOMALY_TIME_MS / 
+                                      self.multiranger.period_in_ms)
+            self.final_inspection_result = self._anomaly_count >= min_anomalies
 
 
     def __final_inspection_response(self) -> None:
@@ -353,6 +391,7 @@ def main() -> None:
     try: smart_inspection.interactive_mode()
     except KeyboardInterrupt:...
     except Exception as ex: print(f"Interactive mode gets an error: {ex}")
+    finally: smart_inspection.slm.unload_model()
 
 
 if __name__ == "__main__":